@@ -0,0 +1,50 @@
+import logging
+import os
+from functools import lru_cache
+from pathlib import Path
+from rag_pipeline.applying_to_LLM import ConstitutionQA
+from rag_pipeline.retriever import ConstitutionRetriever
+
+ROOT_DIR = Path(__file__).resolve().parent.parent.parent
+
+DB_PATH = ROOT_DIR / "data" / "vector_db" / "chroma_db"
+CHROMA_HOST = os.getenv("CHROMA_HOST")
+CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8001"))
+
+logger = logging.getLogger("ConstitutionAPI")
+
+
+@lru_cache(maxsize=1)
+def get_retriever() -> ConstitutionRetriever:
+    """
+    Возвращает единственный экземпляр ретривера для процесса.
+    Модели и индекс загружаются при первом вызове, что позволяет
+    прогреть их заранее (например, до форка воркеров)
+
+    Returns:
+        Экземпляр ConstitutionRetriever
+    """
+    logger.info("Инициализация ретривера для API...")
+    return ConstitutionRetriever(
+        str(DB_PATH),
+        use_reranker=True,
+        chroma_host=CHROMA_HOST,
+        chroma_port=CHROMA_PORT
+    )
+
+
+@lru_cache(maxsize=1)
+def get_qa_system() -> ConstitutionQA:
+    """
+    Возвращает единственный экземпляр QA системы для процесса
+
+    Returns:
+        Экземпляр ConstitutionQA
+    """
+    logger.info("Инициализация QA системы для API...")
+    return ConstitutionQA(
+        retriever=get_retriever(),
+        model_name="mistral:instruct",
+        temperature=0.1,
+        timeout=120
+    )
@@ -1,10 +1,14 @@
 import logging
+import time
+from functools import partial
 from typing import Any, Optional
+import anyio
+import numpy as np
 from fastapi import FastAPI, HTTPException, status
 from pydantic import BaseModel
 from pathlib import Path
-from rag_pipeline.applying_to_LLM import ConstitutionQA
-from rag_pipeline.retriever import ConstitutionRetriever
+from rag_pipeline.semantic_cache import SemanticCache
+from .dependencies import get_qa_system, get_retriever
 
 ROOT_DIR = Path(__file__).resolve().parent.parent.parent
 
@@ -19,29 +23,46 @@ logging.basicConfig(
 )
 logger = logging.getLogger("ConstitutionAPI")
 
-DB_PATH = ROOT_DIR / "data" / "vector_db" / "chroma_db"
+MAX_CONCURRENT_REQUESTS = 4
+ANSWER_CACHE_SIZE = 10000
+ANSWER_CACHE_THRESHOLD = 0.97
 
 try:
-    logger.info("Инициализация ретривера для API...")
-    retriever = ConstitutionRetriever(str(DB_PATH), use_reranker=True)
-    
-    logger.info("Инициализация QA системы для API...")
-    qa_system = ConstitutionQA(
-        retriever=retriever,
-        model_name="mistral:instruct",
-        temperature=0.1,
-        timeout=120
-    )
+    retriever = get_retriever()
+    qa_system = get_qa_system()
     logger.info("API успешно инициализировано")
 except Exception as e:
     logger.critical(f"Критическая ошибка при инициализации API: {e}", exc_info=True)
     raise
 
+qa_limiter = anyio.CapacityLimiter(MAX_CONCURRENT_REQUESTS)
+answer_cache = SemanticCache(
+    dim=retriever.embedding_model.get_sentence_embedding_dimension(),
+    max_entries=ANSWER_CACHE_SIZE,
+    threshold=ANSWER_CACHE_THRESHOLD
+)
+
 app = FastAPI(
     title="ConstitutionQA API",
     description="API для вопросов и ответов по Конституции РФ"
 )
 
+def lookup_cached_answer(question: str, params: tuple[int, int]) -> tuple[np.ndarray, Optional[dict[str, Any]]]:
+    """
+    Векторизация вопроса и поиск ответа в семантическом кэше.
+    Выполняется в рабочем потоке вне qa_limiter, чтобы попадания в кэш
+    не ждали освобождения слотов, занятых генерацией ответов
+
+    Args:
+        question: Вопрос пользователя
+        params: Параметры поиска (n_initial, n_final)
+
+    Returns:
+        Эмбеддинг вопроса и сохраненный ответ или None
+    """
+    query_embedding = retriever.embed(question)
+    return query_embedding, answer_cache.get(query_embedding, key=params)
+
 class QuestionRequest(BaseModel):
     question: str
     n_initial: int = 10
@@ -67,13 +88,34 @@ async def ask_question(request: QuestionRequest):
     Returns:
         Ответ с источниками и метаданными
     """
+    start_time = time.time()
     logger.info(f"Получен запрос: '{request.question}'")
     
     try:
-        result = qa_system.answer_question(
-            query=request.question,
-            n_initial=request.n_initial,
-            n_final=request.n_final
+        params = (request.n_initial, request.n_final)
+        query_embedding, cached = await anyio.to_thread.run_sync(
+            lookup_cached_answer,
+            request.question,
+            params
+        )
+        if cached is not None:
+            logger.info("Ответ найден в семантическом кэше")
+            return await anyio.to_thread.run_sync(
+                qa_system.record_cached_answer,
+                request.question,
+                cached,
+                start_time
+            )
+
+        result = await anyio.to_thread.run_sync(
+            partial(
+                qa_system.answer_question,
+                query=request.question,
+                n_initial=request.n_initial,
+                n_final=request.n_final,
+                query_embedding=query_embedding
+            ),
+            limiter=qa_limiter
         )
         
         if "error" in result:
@@ -83,6 +125,8 @@ async def ask_question(request: QuestionRequest):
                 detail=result["error"]
             )
             
+        answer_cache.put(query_embedding, result, key=params)
+
         logger.info(f"Запрос успешно обработан за {result['execution_time']:.2f} секунд")
         return result
         
@@ -1,36 +1,78 @@
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import Optional
 import chromadb
+import numpy as np
+import torch
 from chromadb.errors import NotFoundError
 from sentence_transformers import SentenceTransformer
 from tqdm import tqdm
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class SentenceTransformerEmbedding:
     """Класс-обертка для SentenceTransformer, совместимый с ChromaDB """
-    def __init__(self, model_name: str):
-        self.model = SentenceTransformer(model_name)
+    def __init__(self, model_name: str, device: Optional[str] = None, show_progress_bar: bool = False):
+        self.show_progress_bar = show_progress_bar
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+
+        self.model = SentenceTransformer(model_name, device=device)
+        if device == "cuda":
+            self.model.half()
 
-    def __call__(self, input: list[str]) -> list[list[float]]:
+    def __call__(self, input: list[str]) -> np.ndarray:
         embeddings = self.model.encode(
             input,
+            batch_size=64,
             normalize_embeddings=True,
-            show_progress_bar=True
+            convert_to_numpy=True,
+            show_progress_bar=self.show_progress_bar
         )
-        return embeddings.tolist()
+        return embeddings.astype(np.float32, copy=False)
 
 
-def initialize_vector_db(chunks_metadata_path: str, persist_directory: str):
+def quantize_embeddings(embeddings: np.ndarray) -> tuple[np.ndarray, float]:
+    """
+    Симметричное квантование (один масштаб на весь тензор) эмбеддингов в INT8
+
+    Args:
+        embeddings: Нормализованные эмбеддинги FP32
+
+    Returns:
+        Кортеж из квантованных эмбеддингов INT8 и масштаба для деквантования
+    """
+    scale = 127.0 / float(np.max(np.abs(embeddings)))
+    quantized = np.round(embeddings * scale).astype(np.int8)
+    return quantized, scale
+
+
+def initialize_vector_db(chunks_metadata_path: str, persist_directory: str, embeddings_path: Optional[str] = None):
     """
     Инициализация и заполнение векторной базы данных ChromaDB
 
     Args:
         chunks_metadata_path: Путь к файлу с метаданными чанков
         persist_directory: Директория для сохранения векторной БД
+        embeddings_path: Путь для сохранения эмбеддингов в INT8 (опционально).
+            Рядом сохраняется JSON с масштабом, размерностью и типом данных.
+            Читать следует через np.load(..., mmap_mode="r") и деквантовать
+            (деление на масштаб, приведение к float32) только непосредственно
+            перед вычислением скалярных произведений
     """
 
-    with open(chunks_metadata_path, "r", encoding="utf-8") as f:
-        chunks_metadata = json.load(f)
+    if orjson is not None:
+        with open(chunks_metadata_path, "rb") as f:
+            chunks_metadata = orjson.loads(f.read())
+    else:
+        with open(chunks_metadata_path, "r", encoding="utf-8") as f:
+            chunks_metadata = json.load(f)
 
     print(f"Загружено {len(chunks_metadata)} чанков для векторизации")
 
@@ -52,12 +94,20 @@ def initialize_vector_db(chunks_metadata_path: str, persist_directory: str):
     except NotFoundError:
         print(f"Коллекция '{collection_name}' не существует. Создаем новую...")
 
-    embedding_fn = SentenceTransformerEmbedding("deepvk/USER-bge-m3")
+    embedding_fn = SentenceTransformerEmbedding("deepvk/USER-bge-m3", show_progress_bar=True)
 
     collection = client.create_collection(
         name=collection_name,
-        embedding_function=embedding_fn,
-        metadata={"hnsw:space": "cosine"},
+        # M - число связей узла в графе HNSW (выше - лучше recall, больше памяти),
+        # construction_ef - ширина поиска при построении (выше - качественнее граф, дольше сборка),
+        # search_ef - ширина поиска при запросе (выше - лучше recall, ниже QPS)
+        metadata={
+            "hnsw:space": "cosine",
+            "hnsw:construction_ef": 128,
+            "hnsw:M": 24,
+            "hnsw:search_ef": 100,
+            "hnsw:num_threads": os.cpu_count() or 1
+        },
         get_or_create=True
     )
     print(f"Коллекция '{collection_name}' создана")
@@ -74,30 +124,63 @@ def initialize_vector_db(chunks_metadata_path: str, persist_directory: str):
         }
         metadatas.append(metadata)
 
-    batch_size = 50
+    unique_positions: dict[str, int] = {}
+    inverse = [unique_positions.setdefault(text, len(unique_positions)) for text in documents]
+    unique_documents = list(unique_positions)
+
+    print(f"Векторизация {len(unique_documents)} уникальных чанков из {len(documents)}...")
+    unique_embeddings = embedding_fn(unique_documents)
+    embeddings = unique_embeddings[inverse]
+
+    if embeddings_path is not None:
+        quantized, scale = quantize_embeddings(embeddings)
+        embeddings_file = Path(embeddings_path)
+        embeddings_file.parent.mkdir(parents=True, exist_ok=True)
+        np.save(embeddings_file, quantized)
+
+        embeddings_meta = {
+            "count": int(quantized.shape[0]),
+            "dimensions": int(quantized.shape[1]),
+            "dtype": "int8",
+            "scale": scale
+        }
+        with open(embeddings_file.with_suffix(".json"), "w", encoding="utf-8") as f:
+            json.dump(embeddings_meta, f, ensure_ascii=False, indent=2)
+
+        print(f"Эмбеддинги INT8 сохранены: {embeddings_file}")
+
+    batch_size = max(1, min(1000, client.get_max_batch_size(), len(ids)))
     total_batches = (len(ids) + batch_size - 1) // batch_size
 
-    for i in tqdm(range(0, len(ids), batch_size), desc="Заполнение БД", total=total_batches):
-        end_idx = min(i + batch_size, len(ids))
+    def add_batch(start_idx: int) -> None:
+        end_idx = min(start_idx + batch_size, len(ids))
         collection.add(
-            ids=ids[i:end_idx],
-            documents=documents[i:end_idx],
-            metadatas=metadatas[i:end_idx]
+            ids=ids[start_idx:end_idx],
+            embeddings=embeddings[start_idx:end_idx],
+            documents=documents[start_idx:end_idx],
+            metadatas=metadatas[start_idx:end_idx]
         )
 
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(add_batch, i) for i in range(0, len(ids), batch_size)]
+        for future in tqdm(as_completed(futures), desc="Заполнение БД", total=total_batches):
+            future.result()
+
     print(f"Векторная база данных успешно заполнена {len(ids)} документами")
     return client, collection
 
 PROJECT_ROOT = Path(__file__).parent.parent.parent
 CHUNKS_METADATA_PATH = PROJECT_ROOT / "data" / "processed" / "chunks_metadata.json"
 PERSIST_DIRECTORY = PROJECT_ROOT / "data" / "vector_db" / "chroma_db"
+EMBEDDINGS_PATH = PROJECT_ROOT / "data" / "processed" / "embeddings_int8.npy"
 
 if not CHUNKS_METADATA_PATH.exists():
     raise FileNotFoundError(f"Файл метаданных не найден: {CHUNKS_METADATA_PATH}")
 
 client, collection = initialize_vector_db(
     str(CHUNKS_METADATA_PATH),
-    str(PERSIST_DIRECTORY)
+    str(PERSIST_DIRECTORY),
+    str(EMBEDDINGS_PATH)
 )
 
 print(f"\nВекторная база данных успешно инициализирована и сохранена в: {PERSIST_DIRECTORY}")
@@ -1,8 +1,52 @@
 import re
+from collections import Counter
 from pathlib import Path
+from typing import Optional
 from langchain_core.documents import Document
 import json
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+# Заголовки глав и статей распознаются одним регулярным выражением за один проход по тексту
+_SECTION_RE = re.compile(
+    r'(?:^|\n)(?P<chapter>ГЛАВА\s+\d+\.)(?:\s*(?P<subtitle>[^\n]+))?'
+    r'|(?P<article>\nСтатья\s+\d+(?:\.\d+)*[^.]*)'
+)
+_ARTICLE_NUM_RE = re.compile(r'Статья\s+(\d+(?:\.\d+)*)')
+_ARTICLE_HEADER_RE = re.compile(r'^\s*Статья\s+\d+(?:\.\d+)*[^\n]*\n?', flags=re.IGNORECASE | re.MULTILINE)
+_NUMBER_DOT_RE = re.compile(r'(\d+)\s*\.\s*')
+# Сноски (<1>, <*>) вместе с окружающими пробелами и любые другие пробельные
+# последовательности заменяются одним пробелом за один проход
+_CLEAN_RE = re.compile(r'(?:\s*(?:<\d+>|<\*>)[^\n]*)+\s*|\s+')
+
+def _build_article_chunk(article_header: str, article_content: str, chapter: str) -> Optional[Document]:
+    """Формирование чанка статьи из ее заголовка и текста"""
+
+    article_num_match = _ARTICLE_NUM_RE.search(article_header)
+    if not article_num_match:
+        return None
+
+    article_number = article_num_match.group(1)
+
+    article_content_clean = _ARTICLE_HEADER_RE.sub('', article_content.strip(), count=1)
+    article_content_clean = _CLEAN_RE.sub(' ', article_content_clean).strip()
+
+    full_text = f"{article_header}\n{article_content_clean}"
+    full_text = _NUMBER_DOT_RE.sub(r'\1. ', full_text)
+
+    return Document(
+        page_content=full_text,
+        metadata={
+            "chapter": chapter,
+            "article_number": article_number,
+            "source": "Конституция РФ"
+        }
+    )
+
 def chunk_constitution(text_path: str) -> list[Document]:
     """Чанкирование Конституции РФ с автоматическим определением глав и поддержкой дополнительных номеров статей"""
     
@@ -13,69 +57,35 @@ def chunk_constitution(text_path: str) -> list[Document]:
     with open(file_path, "r", encoding="utf-8") as f:
         text = f.read()
     
-    text = re.sub(r'\xa0', ' ', text)
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = text.replace('\xa0', ' ')
+    text = _BLANK_LINES_RE.sub('\n\n', text)
     
     print(f"Текст загружен. Длина: {len(text)} символов")
     
-    chapter_pattern = r'(?:^|\n)(ГЛАВА\s+\d+\.)(?:\s*([^\n]+))?'
-    chapters = re.split(chapter_pattern, text)[1:]
-    
     chunks = []
-    current_chapter = "Преамбула"
-    
-    for i in range(0, len(chapters), 3):
-        chapter_title = chapters[i].strip()
-        chapter_subtitle = chapters[i+1].strip() if i+1 < len(chapters) and chapters[i+1] else ""
-        
-        if chapter_subtitle:
-            current_chapter = f"{chapter_title} {chapter_subtitle}".strip()
-        else:
-            current_chapter = chapter_title
-        
-        chapter_content = chapters[i+2] if i+2 < len(chapters) else ""
-        
-        if "ЗАКЛЮЧИТЕЛЬНЫЕ И ПЕРЕХОДНЫЕ ПОЛОЖЕНИЯ" in current_chapter:
-            continue
-            
-        article_blocks = re.split(r'(\nСтатья\s+\d+(?:\.\d+)*[^.]*)', chapter_content)[1:]
-        
-        for j in range(0, len(article_blocks), 2):
-            if j+1 >= len(article_blocks):
-                break
-                
-            article_header = article_blocks[j].strip()
-            article_content = article_blocks[j+1].strip()
-            
-            article_num_match = re.search(r'Статья\s+(\d+(?:\.\d+)*)', article_header)
-            if not article_num_match:
-                continue
-                
-            article_number = article_num_match.group(1)
-            
-            article_content_clean = re.sub(
-                r'^\s*Статья\s+\d+(?:\.\d+)*[^\n]*\n?',
-                '',
-                article_content,
-                count=1,
-                flags=re.IGNORECASE | re.MULTILINE
-            )
-
-            article_content_clean = re.sub(r'<\d+>.*?(?=\n|$)', '', article_content_clean, flags=re.DOTALL)
-            article_content_clean = re.sub(r'<\*>.*?(?=\n|$)', '', article_content_clean, flags=re.DOTALL)
-            article_content_clean = re.sub(r'\s+', ' ', article_content_clean).strip()
-
-            full_text = f"{article_header}\n{article_content_clean}"
-            full_text = re.sub(r'(\d+)\s*\.\s*', r'\1. ', full_text)
-            
-            chunks.append(Document(
-                page_content=full_text,
-                metadata={
-                    "chapter": current_chapter,
-                    "article_number": article_number,
-                    "source": "Конституция РФ"
-                }
-            ))
+    current_chapter = None
+    pending_article = None
+
+    for match in _SECTION_RE.finditer(text):
+        if pending_article is not None:
+            article_header, article_chapter, content_start = pending_article
+            chunk = _build_article_chunk(article_header, text[content_start:match.start()], article_chapter)
+            if chunk is not None:
+                chunks.append(chunk)
+            pending_article = None
+
+        if match.group("chapter"):
+            chapter_title = match.group("chapter").strip()
+            chapter_subtitle = (match.group("subtitle") or "").strip()
+            current_chapter = f"{chapter_title} {chapter_subtitle}".strip() if chapter_subtitle else chapter_title
+        elif current_chapter is not None and "ЗАКЛЮЧИТЕЛЬНЫЕ И ПЕРЕХОДНЫЕ ПОЛОЖЕНИЯ" not in current_chapter:
+            pending_article = (match.group("article").strip(), current_chapter, match.end())
+
+    if pending_article is not None:
+        article_header, article_chapter, content_start = pending_article
+        chunk = _build_article_chunk(article_header, text[content_start:], article_chapter)
+        if chunk is not None:
+            chunks.append(chunk)
             
     print(f"Создано {len(chunks)} чанков (статей)")
     return chunks
@@ -99,16 +109,17 @@ metadata = [{
 } for chunk in chunks]
 
 METADATA_PATH.parent.mkdir(parents=True, exist_ok=True)
-with open(METADATA_PATH, "w", encoding="utf-8") as f:
-    json.dump(metadata, f, ensure_ascii=False, indent=2)
+if orjson is not None:
+    with open(METADATA_PATH, "wb") as f:
+        f.write(orjson.dumps(metadata, option=orjson.OPT_INDENT_2))
+else:
+    with open(METADATA_PATH, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=2)
 
 print(f"\nМетаданные сохранены: {METADATA_PATH}")
 print(f"Статистика по главам:")
 
-chapter_stats = {}
-for chunk in chunks:
-    chapter = chunk.metadata["chapter"]
-    chapter_stats[chapter] = chapter_stats.get(chapter, 0) + 1
+chapter_stats = Counter(chunk.metadata["chapter"] for chunk in chunks)
 
 for chapter, count in chapter_stats.items():
     print(f"  {chapter}: {count} статей")
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Any
 
 st.set_page_config(
@@ -9,6 +10,17 @@ st.set_page_config(
 )
 
 API_URL = "http://localhost:8000/ask"
+HEALTH_URL = "http://localhost:8000/health"
+
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Создает HTTP-сессию с пулом соединений, общую для всех перезапусков скрипта"""
+    session = requests.Session()
+    session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+SESSION = get_http_session()
 
 st.title("🇷🇺 Конституция Российской Федерации")
 st.markdown("### Задайте ваш вопрос, и я найду ответ в Конституции РФ")
@@ -20,7 +32,7 @@ def ask_question(question: str) -> dict[str, Any]:
     """Отправляет вопрос к FastAPI и возвращает ответ"""
     try:
         with st.spinner("Ищу ответ в Конституции РФ..."):
-            response = requests.post(
+            response = SESSION.post(
                 API_URL,
                 json={
                     "question": question,
@@ -127,7 +139,7 @@ with st.sidebar:
     st.markdown("**Статус API:**")
     
     try:
-        response = requests.get("http://localhost:8000/health", timeout=2)
+        response = SESSION.get(HEALTH_URL, timeout=2)
         if response.status_code == 200:
             st.success("API работает!")
         else:
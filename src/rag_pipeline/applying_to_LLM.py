@@ -1,5 +1,13 @@
+import asyncio
+import atexit
 import logging
+import os
+import random
+import threading
 from typing import Any, Optional
+import httpx
+import numpy as np
+from ollama import ResponseError
 from langchain_ollama import OllamaLLM
 from langchain_core.messages import BaseMessage
 from langchain_core.output_parsers import StrOutputParser
@@ -10,6 +18,11 @@ import json
 from pathlib import Path
 from langchain_core.messages import HumanMessage, AIMessage
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
@@ -20,13 +33,51 @@ logging.basicConfig(
 )
 logger = logging.getLogger("ConstitutionQA")
 
+RETRYABLE_ERRORS = (httpx.TransportError, ConnectionError, TimeoutError)
+RETRYABLE_STATUS_CODES = {429}
+MAX_RETRY_DELAY = 16
+
+def _is_retryable(error: Exception) -> bool:
+    """
+    Проверка, имеет ли смысл повторять запрос к LLM после ошибки:
+    сетевые ошибки, перегрузка (429) и ошибки сервера Ollama (5xx)
+    
+    Args:
+        error: Возникшее исключение
+        
+    Returns:
+        True, если запрос можно повторить
+    """
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500 or error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+def _retry_delay(attempt: int) -> float:
+    """
+    Задержка перед повторной попыткой: экспоненциальная с ограничением и случайным разбросом
+    
+    Args:
+        attempt: Номер неудавшейся попытки (с нуля)
+        
+    Returns:
+        Задержка в секундах
+    """
+    return min(MAX_RETRY_DELAY, 2 ** attempt) * random.uniform(0.5, 1.5)
+
 class ConstitutionQA:
     """
-    Система вопросов и ответов по Конституции РФ с использованием RAG
+    Система вопросов и ответов по Конституции РФ с использованием RAG.
+    Асинхронный клиент Ollama привязывает соединения к циклу событий, в котором
+    они открыты, поэтому асинхронные методы одного экземпляра должны вызываться
+    только из одного цикла событий: либо через answer_batch (собственный цикл
+    экземпляра), либо из одного внешнего цикла через answer_question_async
+    и answer_batch_async, но не вперемешку
     """
 
     def __init__(self, retriever: ConstitutionRetriever, model_name: str = "mistral:instruct", temperature: float = 0.1,
-                max_retries: int = 3, timeout: int = 120):
+                max_retries: int = 3, timeout: int = 120, max_concurrency: Optional[int] = None):
         """
         Инициализация системы вопросов и ответов
         
@@ -36,26 +87,41 @@ class ConstitutionQA:
             temperature: Температура генерации (0.0-1.0)
             max_retries: Максимальное количество попыток при ошибках
             timeout: Таймаут запроса в секундах
+            max_concurrency: Максимальное количество одновременных запросов к LLM
+                при пакетной обработке (по умолчанию OLLAMA_NUM_PARALLEL или 4)
         """
         self.retriever = retriever
         self.model_name = model_name
         self.temperature = temperature
         self.max_retries = max_retries
         self.timeout = timeout
+        self.max_concurrency = max_concurrency or int(os.getenv("OLLAMA_NUM_PARALLEL", "4"))
         
         Path("logs").mkdir(exist_ok=True)
         
+        self._log_lock = threading.Lock()
+        self._log_fh = open("data/logs/interactions.jsonl", "ab", buffering=1 << 16)
+        atexit.register(self._log_fh.close)
+        
         logger.info(f"Инициализация LLM: {model_name} с temperature={temperature}")
         
         self.llm = OllamaLLM(
             model=model_name,
             temperature=temperature,
             base_url="http://localhost:11434",
-            timeout=timeout
+            timeout=timeout,
+            client_kwargs={
+                "limits": httpx.Limits(max_keepalive_connections=16, keepalive_expiry=300)
+            }
         )
         
         self.prompt_template = create_constitution_prompt_template()
         self.chat_history: list[BaseMessage] = []
+        self._history_lock = threading.Lock()
+        
+        self._runner = asyncio.Runner()
+        self._runner_lock = threading.Lock()
+        atexit.register(self._runner.close)
         
         self.qa_chain = (
             self.prompt_template
@@ -88,19 +154,204 @@ class ConstitutionQA:
             "temperature": self.temperature
         }
         
-        with open("data/logs/interactions.jsonl", "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        if orjson is not None:
+            line = orjson.dumps(log_entry) + b"\n"
+        else:
+            line = (json.dumps(log_entry, ensure_ascii=False) + "\n").encode("utf-8")
+        
+        with self._log_lock:
+            self._log_fh.write(line)
+    
+    def _flush_log(self) -> None:
+        """Сброс буфера журнала взаимодействий на диск"""
+        with self._log_lock:
+            self._log_fh.flush()
+    
+    def _history_snapshot(self) -> list[BaseMessage]:
+        """Копия истории диалога, согласованная с параллельными запросами"""
+        with self._history_lock:
+            return list(self.chat_history)
+    
+    def _append_history(self, messages: list[BaseMessage]) -> None:
+        """
+        Добавление сообщений в историю диалога одной операцией,
+        чтобы пары вопрос-ответ параллельных запросов не перемешивались
+        
+        Args:
+            messages: Сообщения для добавления
+        """
+        with self._history_lock:
+            self.chat_history.extend(messages)
+    
+    def _prepare_prompt(self, query: str, documents: list[dict[str, Any]],
+                        chat_history: Optional[list[BaseMessage]] = None) -> dict[str, Any]:
+        """
+        Формирование переменных промпта по найденным документам
+        
+        Args:
+            query: Запрос пользователя
+            documents: Релевантные документы
+            chat_history: История диалога (по умолчанию текущая история системы)
+            
+        Returns:
+            Словарь с переменными для промпта
+        """
+        logger.info(f"Получено {len(documents)} релевантных документов")
+        
+        return create_system_prompt(
+            query=query,
+            retrieved_docs=documents,
+            chat_history=self._history_snapshot() if chat_history is None else chat_history
+        )
+    
+    def _empty_result(self, query: str, start_time: float) -> dict[str, Any]:
+        """
+        Результат для случая, когда релевантные документы не найдены
+        
+        Args:
+            query: Запрос пользователя
+            start_time: Время начала обработки запроса
+            
+        Returns:
+            Словарь с ответом и метаданными
+        """
+        return {
+            "query": query,
+            "answer": "В Конституции РФ нет информации по данному вопросу.",
+            "sources": [],
+            "execution_time": time.time() - start_time,
+            "model": self.model_name,
+            "temperature": self.temperature
+        }
+    
+    def _finalize_result(self, query: str, documents: list[dict[str, Any]], prompt_vars: dict[str, Any],
+                         response_text: Optional[str], start_time: float,
+                         history_updates: Optional[list[BaseMessage]] = None) -> dict[str, Any]:
+        """
+        Формирование итогового результата, обновление истории диалога и логирование
+        
+        Args:
+            query: Запрос пользователя
+            documents: Релевантные документы
+            prompt_vars: Переменные промпта, переданные в LLM
+            response_text: Ответ LLM
+            start_time: Время начала обработки запроса
+            history_updates: Список, в который добавляются сообщения вместо истории
+                диалога (для отложенного обновления истории пакетом)
+            
+        Returns:
+            Словарь с ответом, источниками и метаданными
+        """
+        execution_time = time.time() - start_time
+        sources = [
+            {
+                "article_number": doc["metadata"]["article_number"],
+                "chapter": doc["metadata"]["chapter"],
+                "text_excerpt": doc["text"],
+                "score": doc.get("rerank_score", doc.get("score", 0))
+            }
+            for doc in documents
+        ]
+        
+        result = {
+            "query": query,
+            "answer": response_text or "Не удалось получить ответ от LLM",
+            "sources": sources,
+            "execution_time": execution_time,
+            "model": self.model_name,
+            "temperature": self.temperature
+        }
+        
+        turn = [HumanMessage(content=query), AIMessage(content=response_text)]
+        if history_updates is None:
+            self._append_history(turn)
+        else:
+            history_updates.extend(turn)
+        
+        context = prompt_vars["context"]
+        self._log_interaction(
+            query=query,
+            context=context,
+            response=result["answer"],
+            sources=sources,
+            execution_time=execution_time
+        )
+        
+        logger.info(f"Запрос успешно обработан за {execution_time:.2f} секунд")
+        return result
+    
+    def _error_result(self, query: str, error: Exception, start_time: float) -> dict[str, Any]:
+        """
+        Формирование результата для запроса, завершившегося ошибкой
+        
+        Args:
+            query: Запрос пользователя
+            error: Возникшее исключение
+            start_time: Время начала обработки запроса
+            
+        Returns:
+            Словарь с сообщением об ошибке и метаданными
+        """
+        execution_time = time.time() - start_time
+        logger.error(f"Ошибка при обработке запроса: {error}", exc_info=True)
+        
+        error_result = {
+            "query": query,
+            "answer": f"Произошла ошибка при обработке запроса: {str(error)}. Пожалуйста, попробуйте позже.",
+            "sources": [],
+            "execution_time": execution_time,
+            "error": str(error)
+        }
+        
+        self._log_interaction(
+            query=query,
+            context="",
+            response=error_result["answer"],
+            sources=[],
+            execution_time=execution_time
+        )
+        
+        return error_result
+    
+    def record_cached_answer(self, query: str, cached_result: dict[str, Any], start_time: float) -> dict[str, Any]:
+        """
+        Оформление ответа, найденного в кэше для близкого запроса:
+        обновление истории диалога и логирование как для обычного ответа
+        
+        Args:
+            query: Запрос пользователя
+            cached_result: Сохраненный результат для близкого запроса
+            start_time: Время начала обработки запроса
+            
+        Returns:
+            Словарь с ответом, источниками и метаданными
+        """
+        execution_time = time.time() - start_time
+        result = {**cached_result, "query": query, "execution_time": execution_time}
+        
+        self._append_history([HumanMessage(content=query), AIMessage(content=result["answer"])])
+        self._log_interaction(
+            query=query,
+            context="",
+            response=result["answer"],
+            sources=result["sources"],
+            execution_time=execution_time
+        )
+        self._flush_log()
+        
+        logger.info(f"Запрос обработан по кэшу за {execution_time:.4f} секунд")
+        return result
     
-    def answer_question(self, query: str,
-                        n_initial: int = 10, n_final: int = 5) -> dict[str, Any]:
+    def answer_question(self, query: str, n_initial: int = 10, n_final: int = 5,
+                        query_embedding: Optional[np.ndarray] = None) -> dict[str, Any]:
         """
         Ответ на вопрос пользователя по Конституции РФ
         
         Args:
             query: Запрос пользователя
-            chat_history: История диалога (опционально)
             n_initial: Количество документов для первичного поиска
             n_final: Количество документов для финального контекста
+            query_embedding: Готовый нормализованный эмбеддинг запроса (если уже вычислен)
             
         Returns:
             Словарь с ответом, источниками и метаданными
@@ -112,26 +363,14 @@ class ConstitutionQA:
             documents = self.retriever.retrieve(
                 query=query,
                 n_initial=n_initial,
-                n_final=n_final
+                n_final=n_final,
+                query_embedding=query_embedding
             )
 
             if not documents:
-                return {
-                    "query": query,
-                    "answer": "В Конституции РФ нет информации по данному вопросу.",
-                    "sources": [],
-                    "execution_time": time.time() - start_time,
-                    "model": self.model_name,
-                    "temperature": self.temperature
-                }
+                return self._empty_result(query, start_time)
 
-            logger.info(f"Получено {len(documents)} релевантных документов")
-            
-            prompt_vars = create_system_prompt(
-                query=query,
-                retrieved_docs=documents,
-                chat_history=self.chat_history
-            )
+            prompt_vars = self._prepare_prompt(query, documents)
             
             response_text = None
             for attempt in range(self.max_retries):
@@ -141,71 +380,168 @@ class ConstitutionQA:
                     response_text = response.strip() if isinstance(response, str) else str(response)
                     break
                 except Exception as e:
+                    if not _is_retryable(e):
+                        raise
                     logger.warning(f"Попытка {attempt + 1} не удалась: {e}")
                     if attempt == self.max_retries - 1:
                         raise
-                    time.sleep(1 * (attempt + 1))
-            
-            execution_time = time.time() - start_time
-            sources = [
-                {
-                    "article_number": doc["metadata"]["article_number"],
-                    "chapter": doc["metadata"]["chapter"],
-                    "text_excerpt": doc["text"],
-                    "score": doc.get("rerank_score", doc.get("score", 0))
-                }
-                for doc in documents
-            ]
-            
-            result = {
-                "query": query,
-                "answer": response_text or "Не удалось получить ответ от LLM",
-                "sources": sources,
-                "execution_time": execution_time,
-                "model": self.model_name,
-                "temperature": self.temperature
-            }
+                    time.sleep(_retry_delay(attempt))
             
-            self.chat_history.append(HumanMessage(content=query))
-            self.chat_history.append(AIMessage(content=response_text))
+            return self._finalize_result(query, documents, prompt_vars, response_text, start_time)
             
-            context = prompt_vars["context"]
-            self._log_interaction(
-                query=query,
-                context=context,
-                response=result["answer"],
-                sources=sources,
-                execution_time=execution_time
-            )
+        except Exception as e:
+            return self._error_result(query, e, start_time)
+        
+        finally:
+            self._flush_log()
+    
+    async def _generate_answer_async(self, query: str, documents: list[dict[str, Any]], start_time: float,
+                                     chat_history: Optional[list[BaseMessage]] = None,
+                                     history_updates: Optional[list[BaseMessage]] = None) -> dict[str, Any]:
+        """
+        Асинхронная генерация ответа по уже найденным документам
+        
+        Args:
+            query: Запрос пользователя
+            documents: Релевантные документы
+            start_time: Время начала обработки запроса
+            chat_history: История диалога для промпта (по умолчанию текущая история системы)
+            history_updates: Список для отложенного обновления истории диалога
+            
+        Returns:
+            Словарь с ответом, источниками и метаданными
+        """
+        try:
+            if not documents:
+                return self._empty_result(query, start_time)
+
+            prompt_vars = self._prepare_prompt(query, documents, chat_history)
+            
+            response_text = None
+            for attempt in range(self.max_retries):
+                try:
+                    logger.info(f"Попытка {attempt + 1}/{self.max_retries} генерации ответа")
+                    response = await self.qa_chain.ainvoke(prompt_vars)
+                    response_text = response.strip() if isinstance(response, str) else str(response)
+                    break
+                except Exception as e:
+                    if not _is_retryable(e):
+                        raise
+                    logger.warning(f"Попытка {attempt + 1} не удалась: {e}")
+                    if attempt == self.max_retries - 1:
+                        raise
+                    await asyncio.sleep(_retry_delay(attempt))
             
-            logger.info(f"Запрос успешно обработан за {execution_time:.2f} секунд")
-            return result
+            return self._finalize_result(query, documents, prompt_vars, response_text, start_time,
+                                         history_updates)
             
         except Exception as e:
-            execution_time = time.time() - start_time
-            logger.error(f"Ошибка при обработке запроса: {e}", exc_info=True)
-            
-            error_result = {
-                "query": query,
-                "answer": f"Произошла ошибка при обработке запроса: {str(e)}. Пожалуйста, попробуйте позже.",
-                "sources": [],
-                "execution_time": execution_time,
-                "error": str(e)
-            }
+            return self._error_result(query, e, start_time)
+    
+    async def answer_question_async(self, query: str,
+                                    n_initial: int = 10, n_final: int = 5) -> dict[str, Any]:
+        """
+        Асинхронный ответ на вопрос пользователя по Конституции РФ.
+        Генерация выполняется через ainvoke, поэтому несколько запросов
+        могут одновременно обрабатываться сервером Ollama.
+        Экземпляр должен использоваться только из одного цикла событий
+        и не сочетаться с вызовами answer_batch
+        
+        Args:
+            query: Запрос пользователя
+            n_initial: Количество документов для первичного поиска
+            n_final: Количество документов для финального контекста
             
-            self._log_interaction(
+        Returns:
+            Словарь с ответом, источниками и метаданными
+        """
+        start_time = time.time()
+        logger.info(f"Обработка запроса: '{query}'")
+        
+        try:
+            documents = await asyncio.to_thread(
+                self.retriever.retrieve,
                 query=query,
-                context="",
-                response=error_result["answer"],
-                sources=[],
-                execution_time=execution_time
+                n_initial=n_initial,
+                n_final=n_final
             )
+        except Exception as e:
+            result = self._error_result(query, e, start_time)
+        else:
+            result = await self._generate_answer_async(query, documents, start_time)
+
+        self._flush_log()
+        return result
+    
+    async def answer_batch_async(self, queries: list[str],
+                                 n_initial: int = 10, n_final: int = 5) -> list[dict[str, Any]]:
+        """
+        Параллельная обработка запросов пакета. Поиск документов выполняется
+        в отдельном потоке порциями по max_concurrency запросов, и генерация
+        ответов для готовой порции идет одновременно с поиском для следующей.
+        Все запросы пакета видят историю диалога на момент начала пакета,
+        а новые сообщения добавляются в историю после обработки в порядке запросов.
+        Время выполнения каждого запроса отсчитывается от начала поиска для его порции.
+        Экземпляр должен использоваться только из одного цикла событий
+        и не сочетаться с вызовами answer_batch
+        
+        Args:
+            queries: Список запросов
+            n_initial: Количество документов для первичного поиска
+            n_final: Количество документов для финального контекста
+            
+        Returns:
+            Список результатов в порядке запросов
+        """
+        logger.info(f"Параллельная обработка {len(queries)} запросов")
+        
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        chat_history = self._history_snapshot()
+        history_updates: list[list[BaseMessage]] = [[] for _ in queries]
+        
+        async def generate(i: int, query: str, documents: list[dict[str, Any]],
+                           start_time: float) -> dict[str, Any]:
+            async with semaphore:
+                return await self._generate_answer_async(query, documents, start_time,
+                                                         chat_history, history_updates[i])
+        
+        results: list[Optional[dict[str, Any]]] = [None] * len(queries)
+        tasks = []
+        for offset in range(0, len(queries), self.max_concurrency):
+            chunk = queries[offset:offset + self.max_concurrency]
+            start_time = time.time()
+            try:
+                documents_per_query = await asyncio.to_thread(
+                    self.retriever.retrieve_batch,
+                    queries=chunk,
+                    n_initial=n_initial,
+                    n_final=n_final
+                )
+            except Exception as e:
+                for i, query in enumerate(chunk, offset):
+                    results[i] = self._error_result(query, e, start_time)
+                continue
             
-            return error_result
+            for i, (query, documents) in enumerate(zip(chunk, documents_per_query), offset):
+                tasks.append((i, asyncio.create_task(generate(i, query, documents, start_time))))
+        
+        for i, task in tasks:
+            results[i] = await task
+        
+        self._append_history([message for updates in history_updates for message in updates])
+        self._flush_log()
+        return results
     
     def answer_batch(self, queries: list[str]) -> list[dict[str, Any]]:
         """
-        Пакетная обработка запросов
+        Пакетная обработка запросов. Запросы к LLM отправляются одновременно
+        (не более max_concurrency); степень параллелизма на стороне сервера Ollama
+        задается переменными окружения OLLAMA_NUM_PARALLEL (например, 8)
+        и OLLAMA_MAX_LOADED_MODELS=1.
+        Все вызовы выполняются в одном цикле событий экземпляра, к которому
+        привязаны соединения асинхронного клиента Ollama.
+        Не должен вызываться из уже запущенного цикла событий
+        (в этом случае используйте answer_batch_async)
         
         Args:
             queries: Список запросов
@@ -213,11 +549,5 @@ class ConstitutionQA:
         Returns:
             Список результатов для каждого запроса
         """
-        results = []
-        for i, query in enumerate(queries, 1):
-            logger.info(f"Обработка запроса {i}/{len(queries)}: '{query}'")
-            result = self.answer_question(query)
-            results.append(result)
-            time.sleep(0.5)
-        
-        return results
+        with self._runner_lock:
+            return self._runner.run(self.answer_batch_async(queries))
@@ -1,8 +1,12 @@
+from functools import lru_cache
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, HumanMessagePromptTemplate
 from langchain_core.messages import SystemMessage
 from typing import Any, Optional
 from pathlib import Path
 
+_SEPARATOR = "=" * 50
+
+@lru_cache(maxsize=1)
 def load_system_prompt() -> str:
     """
     Загружает системный промпт из файла конфигурации
@@ -22,6 +26,7 @@ def load_system_prompt() -> str:
     
     return system_prompt
 
+@lru_cache(maxsize=1)
 def create_constitution_prompt_template() -> ChatPromptTemplate:
     """
     Создает шаблон промпта для работы с Конституцией РФ
@@ -42,6 +47,14 @@ def create_constitution_prompt_template() -> ChatPromptTemplate:
     
     return prompt_template
 
+def reload_prompt() -> None:
+    """
+    Сбрасывает закэшированные системный промпт и шаблон,
+    чтобы следующий вызов перечитал файл конфигурации
+    """
+    load_system_prompt.cache_clear()
+    create_constitution_prompt_template.cache_clear()
+
 def format_context(documents: list[dict[str, Any]]) -> str:
     """
     Форматирует найденные документы в читаемый формат для промпта
@@ -52,20 +65,17 @@ def format_context(documents: list[dict[str, Any]]) -> str:
     Returns:
         Отформатированная строка с контекстом
     """
-    formatted_context = []
-    
-    for i, doc in enumerate(documents, 1):
-        chapter = doc["metadata"].get("chapter", "не указана")
-        article = doc["metadata"].get("article_number", "не указан")
-        text = doc["text"].strip()
-        
-        formatted_context.append(
-            f"Источник {i}:\n"
-            f"Глава: {chapter}\n"
-            f"Статья: {article}\n"
-            f"Текст статьи:\n{text}\n"
-            f"{'='*50}"
-        )
+    formatted_context = [
+        "\n".join((
+            f"Источник {i}:",
+            f"Глава: {doc['metadata'].get('chapter', 'не указана')}",
+            f"Статья: {doc['metadata'].get('article_number', 'не указан')}",
+            "Текст статьи:",
+            doc["text"].strip(),
+            _SEPARATOR
+        ))
+        for i, doc in enumerate(documents, 1)
+    ]
     
     return "\n\n".join(formatted_context)
 
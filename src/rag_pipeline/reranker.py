@@ -1,15 +1,63 @@
-from langchain_community.cross_encoders import HuggingFaceCrossEncoder
+import numpy as np
+import torch
+from sentence_transformers import CrossEncoder
 
 class CrossEncoderReranker:
-    def __init__(self, model_name="qilowoq/bge-reranker-v2-m3-en-ru"):
-        self.model = HuggingFaceCrossEncoder(model_name=model_name)
+    def __init__(self, model_name="qilowoq/bge-reranker-v2-m3-en-ru", device=None, quantize_on_cpu=True, batch_size=32):
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.batch_size = batch_size
+        dtype = torch.float16 if self.device == "cuda" else torch.float32
 
-    def rerank(self, query, documents):
-        pairs = [(query, d["text"]) for d in documents]
-        scores = self.model.score(pairs)
+        self.model = CrossEncoder(
+            model_name,
+            device=self.device,
+            max_length=512,
+            model_kwargs={"torch_dtype": dtype},
+            tokenizer_kwargs={"use_fast": True}
+        )
 
-        for doc, score in zip(documents, scores):
-            doc["rerank_score"] = float(score)
+        if self.device == "cpu" and quantize_on_cpu:
+            torch.ao.quantization.quantize_dynamic(
+                self.model.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
 
-        documents.sort(key=lambda x: x["rerank_score"], reverse=True)
-        return documents
+    def rerank(self, query, documents, n_final=None, min_score=None):
+        return self.rerank_many([query], [documents], n_final, min_score)[0]
+
+    def rerank_many(self, queries, docs_per_query, n_final=None, min_score=None):
+        """Возвращает новые отсортированные списки; документы дополняются ключом 'rerank_score' на месте"""
+        pairs = [(query, d["text"]) for query, docs in zip(queries, docs_per_query) for d in docs]
+        if not pairs:
+            return [[] for _ in docs_per_query]
+
+        scores = self.model.predict(
+            pairs,
+            batch_size=self.batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=False
+        ).astype(np.float32, copy=False)
+        offsets = np.cumsum([len(docs) for docs in docs_per_query])[:-1]
+
+        reranked = []
+        for docs, doc_scores in zip(docs_per_query, np.split(scores, offsets)):
+            for doc, score in zip(docs, doc_scores.tolist()):
+                doc["rerank_score"] = score
+
+            if min_score is None:
+                candidates = np.arange(len(docs))
+            else:
+                candidates = np.flatnonzero(doc_scores >= min_score)
+            candidate_scores = doc_scores[candidates]
+
+            k = len(candidates) if n_final is None else max(0, min(n_final, len(candidates)))
+            if 0 < k < len(candidates):
+                # берем всех с оценкой не ниже k-й, чтобы при равенстве оценок
+                # стабильная сортировка оставила документы с меньшим индексом
+                kth = -np.partition(-candidate_scores, k - 1)[k - 1]
+                top = np.flatnonzero(candidate_scores >= kth)
+                order = top[np.argsort(-candidate_scores[top], kind="stable")][:k]
+            else:
+                order = np.argsort(-candidate_scores, kind="stable")[:k]
+            reranked.append([docs[i] for i in candidates[order]])
+
+        return reranked
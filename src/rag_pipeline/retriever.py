@@ -1,8 +1,23 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from pathlib import Path
-from typing import Any
+from typing import Any, Optional
 import chromadb
+import numpy as np
 from sentence_transformers import SentenceTransformer
 from .reranker import CrossEncoderReranker
+from .semantic_cache import SemanticCache
+
+@lru_cache(maxsize=None)
+def _get_embedder(model_name: str) -> SentenceTransformer:
+    """Загружает модель векторизации один раз на процесс"""
+    return SentenceTransformer(model_name)
+
+@lru_cache(maxsize=None)
+def _get_reranker(model_name: str) -> CrossEncoderReranker:
+    """Загружает реранкер один раз на процесс"""
+    return CrossEncoderReranker(model_name)
 
 class ConstitutionRetriever:
     """
@@ -10,7 +25,10 @@ class ConstitutionRetriever:
     с поддержкой реранжирования
     """
     
-    def __init__(self, persist_directory: str, use_reranker: bool = True, embedding_model_name: str = "deepvk/USER-bge-m3"):
+    def __init__(self, persist_directory: str, use_reranker: bool = True, embedding_model_name: str = "deepvk/USER-bge-m3",
+                 reranker_model_name: str = "qilowoq/bge-reranker-v2-m3-en-ru", chroma_host: Optional[str] = None,
+                 chroma_port: int = 8001, cache_size: int = 256, semantic_cache_size: int = 1024,
+                 semantic_cache_threshold: float = 0.97):
         """
         Инициализация ретривера
         
@@ -18,78 +36,273 @@ class ConstitutionRetriever:
             persist_directory: Путь к директории с сохраненной векторной БД
             use_reranker: Флаг использования реранкера
             embedding_model_name: Модель для векторизации запросов
+            reranker_model_name: Модель реранкера
+            chroma_host: Хост сервера ChromaDB (если указан, используется сервер
+                вместо локальной БД, например `chroma run --path <persist_directory> --port 8001`)
+            chroma_port: Порт сервера ChromaDB
+            cache_size: Размер LRU-кэша результатов для точных повторов запросов
+            semantic_cache_size: Размер кэша результатов для семантически близких запросов
+            semantic_cache_threshold: Минимальное косинусное сходство запросов для попадания в кэш
         """
         self.persist_directory = Path(persist_directory)
         self.use_reranker = use_reranker
         
-        if not self.persist_directory.exists():
-            raise FileNotFoundError(f"Директория векторной БД не найдена: {self.persist_directory}")
-        
-        self.client = chromadb.PersistentClient(
-            path=str(self.persist_directory),
-            settings=chromadb.Settings(anonymized_telemetry=False)
-        )
+        if chroma_host is not None:
+            self.client = chromadb.HttpClient(
+                host=chroma_host,
+                port=chroma_port,
+                settings=chromadb.Settings(anonymized_telemetry=False)
+            )
+        else:
+            if not self.persist_directory.exists():
+                raise FileNotFoundError(f"Директория векторной БД не найдена: {self.persist_directory}")
+
+            self.client = chromadb.PersistentClient(
+                path=str(self.persist_directory),
+                settings=chromadb.Settings(anonymized_telemetry=False)
+            )
         
         self.collection = self.client.get_collection(
             name="constitution_rag"
         )
         
-        self.embedding_model = SentenceTransformer(embedding_model_name)
+        self.embedding_model = _get_embedder(embedding_model_name)
         
         if self.use_reranker:
-            self.reranker = CrossEncoderReranker()
+            self.reranker = _get_reranker(reranker_model_name)
         else:
             self.reranker = None
         
+        self.cache_size = cache_size
+        self._cache: OrderedDict[tuple, list[dict[str, Any]]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._semantic_cache = SemanticCache(
+            dim=self.embedding_model.get_sentence_embedding_dimension(),
+            max_entries=semantic_cache_size,
+            threshold=semantic_cache_threshold
+        )
+        
         print(f"Ретривер инициализирован. В коллекции {self.collection.count()} документов.")
         if self.use_reranker:
             print("Реранкер активирован для улучшения качества поиска")
     
-    def retrieve(self, query: str, n_initial: int = 10, n_final: int = 5, relevance_threshold: float = 0.5) -> list[dict[str, Any]]:
+    def embed(self, query: str) -> np.ndarray:
         """
-        Поиск релевантных документов по запросу с реранжированием
-        
+        Векторизация запроса пользователя
+
         Args:
             query: Запрос пользователя
+
+        Returns:
+            Нормализованный эмбеддинг запроса
+        """
+        return self.embedding_model.encode(query, normalize_embeddings=True, convert_to_numpy=True)
+
+    def _cache_get(self, key: tuple) -> Optional[list[dict[str, Any]]]:
+        """
+        Поиск результата в LRU-кэше точных повторов запросов
+
+        Args:
+            key: Запрос и параметры поиска
+
+        Returns:
+            Копия списка документов или None, если запрос не найден
+        """
+        with self._cache_lock:
+            docs = self._cache.get(key)
+            if docs is None:
+                return None
+
+            self._cache.move_to_end(key)
+            return list(docs)
+
+    def _semantic_cache_get(self, key: tuple, query_embedding: np.ndarray) -> Optional[list[dict[str, Any]]]:
+        """
+        Поиск результата для семантически близкого запроса с теми же параметрами поиска
+
+        Args:
+            key: Запрос и параметры поиска
+            query_embedding: Нормализованный эмбеддинг запроса
+
+        Returns:
+            Копия списка документов или None, если близкий запрос не найден
+        """
+        cached = self._semantic_cache.get(query_embedding, key=key[1:])
+        if cached is None:
+            return None
+
+        return list(cached)
+
+    def _cache_put(self, key: tuple, query_embedding: np.ndarray, docs: list[dict[str, Any]]) -> None:
+        """
+        Сохранение результата поиска в оба кэша
+
+        Args:
+            key: Запрос и параметры поиска
+            query_embedding: Нормализованный эмбеддинг запроса
+            docs: Найденные документы
+        """
+        if self.cache_size > 0:
+            with self._cache_lock:
+                self._cache[key] = docs
+                self._cache.move_to_end(key)
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        self._semantic_cache.put(query_embedding, docs, key=key[1:])
+
+    def _search(self, query_embedding: np.ndarray, n_initial: int) -> list[dict[str, Any]]:
+        """
+        Первичный поиск ближайших документов в векторной БД
+
+        Args:
+            query_embedding: Нормализованный эмбеддинг запроса
             n_initial: Количество документов для первичного поиска
-            n_final: Количество документов для финального результата
-        
+
         Returns:
-            Список релевантных документов с метаданными
+            Список найденных документов с метаданными и расстояниями
+        """
+        return self._search_many(query_embedding[np.newaxis, :], n_initial)[0]
+
+    def _search_many(self, query_embeddings: np.ndarray, n_initial: int) -> list[list[dict[str, Any]]]:
         """
-        query_embedding = self.embedding_model.encode([query], normalize_embeddings=True).tolist()
+        Первичный поиск ближайших документов для нескольких запросов одним обращением к векторной БД
+
+        Args:
+            query_embeddings: Матрица нормализованных эмбеддингов запросов
+            n_initial: Количество документов для первичного поиска
 
+        Returns:
+            Списки найденных документов в порядке запросов
+        """
         results = self.collection.query(
-            query_embeddings=query_embedding,
+            query_embeddings=np.ascontiguousarray(query_embeddings, dtype=np.float32).tolist(),
             n_results=n_initial,
             include=["documents", "metadatas", "distances"]
         )
         
-        retrieved_docs = []
-        for i in range(len(results["documents"][0])):
-            doc = {
-                "text": results["documents"][0][i],
-                "metadata": results["metadatas"][0][i],
-                "distance": results["distances"][0][i],
-            }
-            retrieved_docs.append(doc)
-        
+        docs_per_query = [
+            [
+                {"text": text, "metadata": metadata, "distance": distance}
+                for text, metadata, distance in zip(texts, metadatas, distances)
+            ]
+            for texts, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"])
+        ]
+
+        return docs_per_query
+
+    def _select(self, query: str, retrieved_docs: list[dict[str, Any]], n_final: int,
+                relevance_threshold: float) -> list[dict[str, Any]]:
+        """
+        Реранжирование и отбор финальных документов
+
+        Args:
+            query: Запрос пользователя
+            retrieved_docs: Документы первичного поиска
+            n_final: Количество документов для финального результата
+            relevance_threshold: Минимальная оценка реранкера
+
+        Returns:
+            Список релевантных документов с метаданными
+        """
         if not retrieved_docs:
             return []
         
         print(f"Найдено {len(retrieved_docs)} документов на первичном этапе для запроса: '{query}'")
          
         if self.use_reranker and self.reranker is not None:
-            reranked_docs = self.reranker.rerank(query, retrieved_docs.copy())
-            filtered_docs = [
-                doc for doc in reranked_docs
-                if doc["rerank_score"] >= relevance_threshold
-            ]
+            return self.reranker.rerank(query, retrieved_docs, n_final, relevance_threshold)
+
+        return retrieved_docs[:n_final]
+
+    def retrieve(self, query: str, n_initial: int = 10, n_final: int = 5, relevance_threshold: float = 0.5,
+                 query_embedding: Optional[np.ndarray] = None) -> list[dict[str, Any]]:
+        """
+        Поиск релевантных документов по запросу с реранжированием
+        
+        Args:
+            query: Запрос пользователя
+            n_initial: Количество документов для первичного поиска
+            n_final: Количество документов для финального результата
+            relevance_threshold: Минимальная оценка реранкера
+            query_embedding: Готовый нормализованный эмбеддинг запроса (если уже вычислен)
+        
+        Returns:
+            Список релевантных документов с метаданными
+        """
+        key = (query, n_initial, n_final, relevance_threshold)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        if query_embedding is None:
+            query_embedding = self.embed(query)
+        cached = self._semantic_cache_get(key, query_embedding)
+        if cached is not None:
+            return cached
+
+        retrieved_docs = self._search(query_embedding, n_initial)
+        docs = self._select(query, retrieved_docs, n_final, relevance_threshold)
+        self._cache_put(key, query_embedding, docs)
+        return list(docs)
+
+    def retrieve_batch(self, queries: list[str], n_initial: int = 10, n_final: int = 5,
+                       relevance_threshold: float = 0.5) -> list[list[dict[str, Any]]]:
+        """
+        Поиск релевантных документов для нескольких запросов.
+        Все запросы векторизуются одним вызовом модели
+
+        Args:
+            queries: Список запросов пользователя
+            n_initial: Количество документов для первичного поиска
+            n_final: Количество документов для финального результата
+            relevance_threshold: Минимальная оценка реранкера
+
+        Returns:
+            Списки релевантных документов в порядке запросов
+        """
+        if not queries:
+            return []
+
+        keys = [(query, n_initial, n_final, relevance_threshold) for query in queries]
+        results: list[Optional[list[dict[str, Any]]]] = [self._cache_get(key) for key in keys]
+        pending = [i for i, cached in enumerate(results) if cached is None]
+        if not pending:
+            return results
+
+        query_embeddings = self.embedding_model.encode(
+            [queries[i] for i in pending],
+            batch_size=32,
+            normalize_embeddings=True,
+            convert_to_numpy=True
+        )
+
+        misses = []
+        for i, query_embedding in zip(pending, query_embeddings):
+            results[i] = self._semantic_cache_get(keys[i], query_embedding)
+            if results[i] is None:
+                misses.append((i, query_embedding))
+
+        if not misses:
+            return results
+
+        docs_per_query = self._search_many(np.stack([query_embedding for _, query_embedding in misses]), n_initial)
+
+        if self.use_reranker and self.reranker is not None:
+            selected_per_query = self.reranker.rerank_many(
+                [queries[i] for i, _ in misses],
+                docs_per_query,
+                n_final,
+                relevance_threshold
+            )
+        else:
+            selected_per_query = [docs[:n_final] for docs in docs_per_query]
 
-            if not filtered_docs:
-                return []
+        for (i, query_embedding), docs in zip(misses, selected_per_query):
+            self._cache_put(keys[i], query_embedding, docs)
+            results[i] = list(docs)
 
-            return filtered_docs[:n_final]
+        return results
     
     def get_context_for_llm(self, query: str, n_initial: int = 10, n_final: int = 5) -> str:
         """
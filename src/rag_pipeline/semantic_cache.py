@@ -0,0 +1,167 @@
+import threading
+from typing import Any, Hashable, Optional
+import numpy as np
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+_SCAN_BLOCK_SIZE = 4096
+
+if njit is not None:
+    @njit(fastmath=True, cache=True)
+    def _scan_int8(cache, scales, query, out):
+        for i in range(cache.shape[0]):
+            s = 0.0
+            for j in range(cache.shape[1]):
+                s += cache[i, j] * query[j]
+            out[i] = s * scales[i]
+else:
+    _scan_int8 = None
+
+
+class SemanticCache:
+    """
+    Кэш результатов по семантической близости запросов.
+    Хранит эмбеддинги запросов в одной непрерывной матрице INT8 с масштабом
+    на каждый вектор и ищет ближайший запрос матрично-векторным произведением.
+    Записи с разными ключами (например, параметрами поиска) не смешиваются
+    """
+
+    def __init__(self, dim: int, max_entries: int = 10000, threshold: float = 0.97):
+        """
+        Инициализация кэша
+
+        Args:
+            dim: Размерность эмбеддингов запросов
+            max_entries: Максимальное количество записей в кэше
+            threshold: Минимальное косинусное сходство для попадания в кэш
+        """
+        self.dim = dim
+        self.max_entries = max_entries
+        self.threshold = threshold
+
+        self._embeddings = np.zeros((max_entries, dim), dtype=np.int8)
+        self._scales = np.zeros(max_entries, dtype=np.float32)
+        self._scores = np.empty(max_entries, dtype=np.float32)
+        self._values: list[Any] = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._entry_keys = np.full(max_entries, -1, dtype=np.int64)
+        self._key_ids: dict[Hashable, int] = {}
+        self._key_counts: dict[Hashable, int] = {}
+        self._slot_keys: list[Hashable] = [None] * max_entries
+        self._next_key_id = 0
+        self._size = 0
+        self._tick = 0
+        self._lock = threading.Lock()
+
+        if _scan_int8 is not None:
+            _scan_int8(
+                np.zeros((1, dim), dtype=np.int8),
+                np.ones(1, dtype=np.float32),
+                np.zeros(dim, dtype=np.float32),
+                np.empty(1, dtype=np.float32)
+            )
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get(self, embedding: np.ndarray, key: Hashable = None) -> Optional[Any]:
+        """
+        Поиск сохраненного результата для семантически близкого запроса с тем же ключом
+
+        Args:
+            embedding: Нормализованный эмбеддинг запроса
+            key: Ключ записи (например, параметры поиска)
+
+        Returns:
+            Сохраненный результат или None, если близкий запрос не найден
+        """
+        with self._lock:
+            key_id = self._key_ids.get(key)
+            if self._size == 0 or key_id is None:
+                return None
+
+            embedding = np.ascontiguousarray(embedding, dtype=np.float32)
+            scores = self._scores[:self._size]
+            if _scan_int8 is not None:
+                _scan_int8(self._embeddings[:self._size], self._scales[:self._size], embedding, scores)
+            else:
+                for start in range(0, self._size, _SCAN_BLOCK_SIZE):
+                    end = min(start + _SCAN_BLOCK_SIZE, self._size)
+                    scores[start:end] = self._embeddings[start:end].astype(np.float32) @ embedding
+                scores *= self._scales[:self._size]
+            scores[self._entry_keys[:self._size] != key_id] = -np.inf
+
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+
+            self._tick += 1
+            self._last_used[best] = self._tick
+            return self._values[best]
+
+    def put(self, embedding: np.ndarray, value: Any, key: Hashable = None) -> None:
+        """
+        Сохранение результата в кэш. При переполнении вытесняется запись,
+        которая дольше всех не использовалась
+
+        Args:
+            embedding: Нормализованный эмбеддинг запроса
+            value: Результат для сохранения
+            key: Ключ записи (например, параметры поиска)
+        """
+        if self.max_entries == 0:
+            return
+
+        with self._lock:
+            if self._size < self.max_entries:
+                slot = self._size
+                self._size += 1
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._release_key(self._slot_keys[slot])
+
+            scale = float(np.max(np.abs(embedding))) / 127.0 or 1.0
+
+            self._tick += 1
+            self._embeddings[slot] = np.round(embedding / scale).astype(np.int8)
+            self._scales[slot] = scale
+            self._values[slot] = value
+            self._entry_keys[slot] = self._acquire_key(key)
+            self._slot_keys[slot] = key
+            self._last_used[slot] = self._tick
+
+    def _acquire_key(self, key: Hashable) -> int:
+        """
+        Получение числового идентификатора ключа для новой записи
+
+        Args:
+            key: Ключ записи
+
+        Returns:
+            Идентификатор ключа
+        """
+        key_id = self._key_ids.get(key)
+        if key_id is None:
+            key_id = self._next_key_id
+            self._next_key_id += 1
+            self._key_ids[key] = key_id
+        self._key_counts[key] = self._key_counts.get(key, 0) + 1
+        return key_id
+
+    def _release_key(self, key: Hashable) -> None:
+        """
+        Освобождение ключа вытесненной записи. Ключ удаляется, когда
+        им не помечена ни одна запись, поэтому число ключей ограничено размером кэша
+
+        Args:
+            key: Ключ записи
+        """
+        count = self._key_counts[key] - 1
+        if count == 0:
+            del self._key_counts[key]
+            del self._key_ids[key]
+        else:
+            self._key_counts[key] = count